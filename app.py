@@ -1,49 +1,160 @@
 import sqlite3
-import subprocess
-import signal
-from flask import Flask, render_template, request, jsonify, send_file, Response
+import atexit
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import io
 import csv
+import re
+import db
+import scrape
 
 app = Flask(__name__)
-DB_PATH = 'esrb_ratings.db'
 
-# Track the active scraper process so it can be cancelled
-scraper_process = None
+# Number of read connections kept open for request handlers
+POOL_SIZE = 4
+
+# Process-wide connection pool: N readers handed out via a queue, plus a
+# single writer guarded by a lock (SQLite allows only one writer at a time)
+_read_pool = None
+_write_conn = None
+_write_lock = threading.Lock()
+_pool_lock = threading.Lock()
+
+def _connect():
+    """Open a connection that can be shared across request threads"""
+    conn = db.connect(check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_pool():
+    """Open the read connections and the write connection"""
+    global _read_pool, _write_conn
+    with _pool_lock:
+        if _read_pool is not None:
+            return
+        _write_conn = _connect()
+        pool = queue.Queue()
+        for _ in range(POOL_SIZE):
+            pool.put(_connect())
+        _read_pool = pool
+
+def close_pool():
+    """Close every pooled connection"""
+    global _read_pool, _write_conn
+    with _pool_lock:
+        if _read_pool is not None:
+            while True:
+                try:
+                    _read_pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            _read_pool = None
+        if _write_conn is not None:
+            _write_conn.close()
+            _write_conn = None
+
+atexit.register(close_pool)
+
+@contextmanager
+def get_conn():
+    """Check out a read connection from the pool"""
+    if _read_pool is None:
+        init_pool()
+    pool = _read_pool
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+@contextmanager
+def get_write_conn():
+    """Hold the write connection exclusively for the duration of the block"""
+    if _write_conn is None:
+        init_pool()
+    with _write_lock:
+        yield _write_conn
+
+# Scraper runs in-process on a single background worker. Each job is
+# tracked by id with its future, captured log lines and cancel flag.
+_executor = ThreadPoolExecutor(max_workers=1)
+_jobs = {}
+_active_job_id = None
+_jobs_lock = threading.Lock()
 
 def init_db():
     """Initialize the SQLite database with schema"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ratings (
-            game_id INTEGER PRIMARY KEY,
-            game_title TEXT NOT NULL,
-            platform TEXT,
-            rating TEXT,
-            descriptors TEXT,
-            url TEXT,
-            summary TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scrape_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scrape_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            games_added INTEGER,
-            games_skipped INTEGER
-        )
-    ''')
-
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rating ON ratings(rating)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_title ON ratings(game_title)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_platform ON ratings(platform)')
-
-    conn.commit()
-    conn.close()
+    with get_write_conn() as conn:
+        db.create_schema(conn)
+
+# Listings skip the (often long) summary text and just flag whether one
+# exists; the summary is fetched per game when the user opens it
+LIST_COLS = "game_id, game_title, platform, rating, descriptors, url, COALESCE(summary, '') != '' AS has_summary"
+FULL_COLS = 'game_id, game_title, platform, rating, descriptors, url, summary'
+
+# Rows written per chunk of the streamed CSV export
+EXPORT_CHUNK_ROWS = 500
+
+# Unfiltered row count and /api/stats payload, each cached as
+# (timestamp, value); both are cleared after a scrape
+TOTAL_CACHE_TTL = 30
+STATS_CACHE_TTL = 30
+_total_cache = None
+_stats_cache = None
+
+def invalidate_caches():
+    """Forget the cached row count and stats"""
+    global _total_cache, _stats_cache
+    _total_cache = None
+    _stats_cache = None
+
+def _unfiltered_total(cursor):
+    """Return the total number of ratings, cached for TOTAL_CACHE_TTL seconds"""
+    global _total_cache
+    cached = _total_cache
+    now = time.time()
+    if cached is None or now - cached[0] > TOTAL_CACHE_TTL:
+        cursor.execute('SELECT COUNT(*) FROM ratings')
+        cached = (now, cursor.fetchone()[0])
+        _total_cache = cached
+    return cached[1]
+
+# Three or more consecutive characters that aren't LIKE wildcards
+_TRIGRAM_RUN_RE = re.compile(r'[^%_]{3,}')
+
+def _search_condition(search_column, search):
+    """SQL condition for a substring search (LIKE '%...%') on search_column"""
+    # The trigram FTS index answers LIKE directly, but only when the pattern
+    # has a 3-character literal run; below that it can't help and it misses
+    # matches that plain LIKE finds (e.g. 2-character non-ASCII terms)
+    if search_column == 'game_title' and _TRIGRAM_RUN_RE.search(search):
+        return 'game_id IN (SELECT rowid FROM ratings_fts WHERE game_title LIKE ?)'
+    return f'{search_column} LIKE ?'
+
+def _where(search, search_column, platform, rating):
+    """Build the WHERE clause and parameters for the ratings filters"""
+    conditions = []
+    params = []
+
+    if search:
+        conditions.append(_search_condition(search_column, search))
+        params.append(f'%{search}%')
+
+    if platform:
+        conditions.append('platform LIKE ?')
+        params.append(f'%{platform}%')
+
+    if rating:
+        conditions.append('rating = ?')
+        params.append(rating)
+
+    clause = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return clause, params
 
 @app.route('/')
 def index():
@@ -53,10 +164,6 @@ def index():
 @app.route('/api/ratings')
 def get_ratings():
     """API endpoint to get ratings with filtering and pagination"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
     # Get query parameters
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 50))
@@ -66,6 +173,8 @@ def get_ratings():
     rating = request.args.get('rating', '')
     sort_col = request.args.get('sort', 'game_id')
     sort_dir = request.args.get('dir', 'desc')
+    after_id = request.args.get('cursor', type=int)  # Last game_id of the previous page
+    fields = request.args.get('fields', '')  # 'full' includes each summary
 
     # Whitelist sortable columns
     allowed_sorts = ['game_id', 'game_title', 'platform', 'rating']
@@ -76,54 +185,62 @@ def get_ratings():
     search_column_map = {'title': 'game_title', 'descriptors': 'descriptors', 'summary': 'summary'}
     search_column = search_column_map.get(search_field, 'game_title')
 
-    # Build query
-    query = 'SELECT * FROM ratings WHERE 1=1'
-    params = []
-
-    if search:
-        query += f' AND {search_column} LIKE ?'
-        params.append(f'%{search}%')
-
-    if platform:
-        query += ' AND platform LIKE ?'
-        params.append(f'%{platform}%')
-
-    if rating:
-        query += ' AND rating = ?'
-        params.append(rating)
-
-    # Get total count
-    count_query = query.replace('SELECT *', 'SELECT COUNT(*)')
-    cursor.execute(count_query, params)
-    total = cursor.fetchone()[0]
-
-    # Add sorting and pagination
-    order_dir = 'DESC' if sort_dir == 'desc' else 'ASC'
-    query += f' ORDER BY {sort_col} {order_dir} LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
-
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-
-    results = [dict(row) for row in rows]
-
-    conn.close()
-
+    where, params = _where(search, search_column, platform, rating)
+    columns = FULL_COLS if fields == 'full' else LIST_COLS
+
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # Plain tuples; rows go out as lists
+
+        # Get total count
+        if where:
+            cursor.execute(f'SELECT COUNT(1) FROM ratings {where}', params)
+            total = cursor.fetchone()[0]
+        else:
+            total = _unfiltered_total(cursor)
+
+        # Add sorting and pagination. When sorting by game_id and the client
+        # passes the previous page's last id, seek past it instead of using
+        # OFFSET, which would scan and discard every earlier row.
+        order_dir = 'DESC' if sort_dir == 'desc' else 'ASC'
+        if sort_col == 'game_id' and after_id is not None:
+            seek = 'game_id < ?' if order_dir == 'DESC' else 'game_id > ?'
+            seek_where = f'{where} AND {seek}' if where else f'WHERE {seek}'
+            query = f'SELECT {columns} FROM ratings {seek_where} ORDER BY game_id {order_dir} LIMIT ?'
+            cursor.execute(query, params + [after_id, per_page])
+        else:
+            query = f'SELECT {columns} FROM ratings {where} ORDER BY {sort_col} {order_dir} LIMIT ? OFFSET ?'
+            cursor.execute(query, params + [per_page, (page - 1) * per_page])
+        column_names = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+
+    # game_id is the first column of both LIST_COLS and FULL_COLS
+    next_cursor = rows[-1][0] if sort_col == 'game_id' and rows else None
+
+    # Column names are sent once rather than repeated as keys on every row
     return jsonify({
-        'data': results,
+        'columns': column_names,
+        'rows': rows,
         'total': total,
         'page': page,
         'per_page': per_page,
-        'total_pages': (total + per_page - 1) // per_page
+        'total_pages': (total + per_page - 1) // per_page,
+        'next_cursor': next_cursor
     })
 
+@app.route('/api/ratings/<int:game_id>')
+def get_rating(game_id):
+    """API endpoint to get a single game, including its summary"""
+    with get_conn() as conn:
+        row = conn.execute(f'SELECT {FULL_COLS} FROM ratings WHERE game_id = ?', (game_id,)).fetchone()
+
+    if row is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(dict(row))
+
 @app.route('/api/export')
 def export_csv():
     """Export filtered data to CSV"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
     # Get query parameters
     search = request.args.get('search', '')
     search_field = request.args.get('search_field', 'title')
@@ -134,124 +251,169 @@ def export_csv():
     search_column_map = {'title': 'game_title', 'descriptors': 'descriptors', 'summary': 'summary'}
     search_column = search_column_map.get(search_field, 'game_title')
 
-    # Get all games, we'll filter in Python for multi-value filters
-    query = 'SELECT * FROM ratings WHERE 1=1'
+    # Build query
+    query = f'SELECT {FULL_COLS} FROM ratings WHERE 1=1'
     params = []
 
     if search:
-        query += f' AND {search_column} LIKE ?'
+        query += f' AND {_search_condition(search_column, search)}'
         params.append(f'%{search}%')
 
-    query += ' ORDER BY game_id DESC'
-
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-
-    # Convert to list of dicts for easier filtering
-    all_games = [dict(row) for row in rows]
-
-    # Filter by platforms (client-side multi-select)
+    # Platform is a comma-separated list, stored with ", " separators (see
+    # db.normalize_platform); match whole entries by wrapping the column in
+    # commas and looking for ",<platform>,"
     if platforms:
         selected_platforms = [p.strip() for p in platforms.split(',')]
-        filtered_games = []
-        for game in all_games:
-            game_platforms = game['platform'].split(',') if game['platform'] else []
-            game_platforms = [p.strip() for p in game_platforms]
-            if any(p in game_platforms for p in selected_platforms):
-                filtered_games.append(game)
-        all_games = filtered_games
-
-    # Filter by ratings (client-side multi-select)
+        clauses = ["instr(',' || REPLACE(platform, ', ', ',') || ',', ?) > 0"] * len(selected_platforms)
+        query += f' AND ({" OR ".join(clauses)})'
+        params.extend(f',{p},' for p in selected_platforms)
+
     if ratings:
         selected_ratings = [r.strip() for r in ratings.split(',')]
-        all_games = [game for game in all_games if game['rating'] in selected_ratings]
-
-    rows = all_games
+        query += f' AND rating IN ({",".join("?" * len(selected_ratings))})'
+        params.extend(selected_ratings)
 
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['game_id', 'game_title', 'platform', 'rating', 'descriptors', 'url', 'summary'])
-
-    for game in rows:
-        writer.writerow([game['game_id'], game['game_title'], game['platform'], game['rating'],
-                        game['descriptors'], game['url'], game['summary']])
+    query += ' ORDER BY game_id DESC'
 
-    conn.close()
+    def generate():
+        # Stream rows straight from the cursor in chunks, reusing one small
+        # buffer, so memory stays flat regardless of export size
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['game_id', 'game_title', 'platform', 'rating', 'descriptors', 'url', 'summary'])
+        yield output.getvalue()
+
+        # A download can take a while, so use a dedicated connection rather
+        # than tying up one of the pooled readers the other routes rely on.
+        # Its rows are plain tuples, whose FULL_COLS order matches the header.
+        conn = db.connect()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                output.seek(0)
+                output.truncate()
+                writer.writerows(rows)
+                yield output.getvalue()
+        finally:
+            conn.close()
 
-    # Convert to bytes for sending
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name='esrb_ratings_export.csv'
+        headers={'Content-Disposition': 'attachment; filename=esrb_ratings_export.csv'}
     )
 
 @app.route('/api/stats')
 def get_stats():
     """Get database statistics"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    global _stats_cache
+    cached = _stats_cache
+    now = time.time()
+    if cached is not None and now - cached[0] <= STATS_CACHE_TTL:
+        return jsonify(cached[1])
 
-    cursor.execute('SELECT COUNT(*) FROM ratings')
-    total = cursor.fetchone()[0]
+    with get_conn() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('SELECT DISTINCT platform FROM ratings WHERE platform != "" ORDER BY platform')
-    platforms = [row[0] for row in cursor.fetchall()]
+        total = _unfiltered_total(cursor)
 
-    cursor.execute('SELECT DISTINCT rating FROM ratings WHERE rating != "" ORDER BY rating')
-    ratings = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT DISTINCT platform FROM ratings WHERE platform != "" ORDER BY platform')
+        platforms = [row[0] for row in cursor.fetchall()]
 
-    cursor.execute('SELECT MAX(scrape_date) FROM scrape_log')
-    last_scrape = cursor.fetchone()[0]
+        cursor.execute('SELECT DISTINCT rating FROM ratings WHERE rating != "" ORDER BY rating')
+        ratings = [row[0] for row in cursor.fetchall()]
 
-    conn.close()
+        cursor.execute('SELECT MAX(scrape_date) FROM scrape_log')
+        last_scrape = cursor.fetchone()[0]
 
-    return jsonify({
+    stats = {
         'total': total,
         'platforms': platforms,
         'ratings': ratings,
         'last_scrape': last_scrape
-    })
+    }
+    _stats_cache = (now, stats)
+    return jsonify(stats)
+
+def _job_status(job):
+    """Summarize a scraper job's state for the API"""
+    future = job['future']
+    if not future.done():
+        return 'running'
+    if future.cancelled() or job['cancel'].is_set():
+        return 'cancelled'
+    if future.exception() is not None:
+        return 'error'
+    return 'done'
+
+def _run_scraper(log, cancel_event):
+    """Run the scraper, clearing cached counts before the job reports done"""
+    try:
+        return scrape.main(log=log, cancel_event=cancel_event)
+    finally:
+        invalidate_caches()
 
 @app.route('/api/fetch-new-data', methods=['POST'])
 def fetch_new_data():
-    """Trigger the scraper and stream its output line by line"""
-    global scraper_process
-
-    def generate():
-        global scraper_process
-        try:
-            scraper_process = subprocess.Popen(
-                ['python3', '-u', 'scrape.py'],
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                text=True
-            )
-            for line in scraper_process.stdout:
-                yield f"data: {line.rstrip()}\n\n"
-            scraper_process.wait()
-            if scraper_process.returncode == 0:
-                yield "data: [DONE]\n\n"
-            else:
-                yield f"data: [ERROR] Scraper exited with code {scraper_process.returncode}\n\n"
-        except Exception as e:
-            yield f"data: [ERROR] {str(e)}\n\n"
-        finally:
-            scraper_process = None
-
-    return Response(generate(), mimetype='text/event-stream')
+    """Start the scraper in the background and return its job id"""
+    global _active_job_id
+
+    # Check and submit under one lock so concurrent POSTs can't queue two jobs
+    with _jobs_lock:
+        job = _jobs.get(_active_job_id)
+        if job and not job['future'].done():
+            return jsonify({'job_id': _active_job_id}), 202
+
+        # Only one job runs at a time, so every tracked job is finished;
+        # drop them (and their logs) rather than keeping them forever
+        _jobs.clear()
+
+        job_id = uuid.uuid4().hex
+        lines = []
+        cancel = threading.Event()
+        future = _executor.submit(_run_scraper, lines.append, cancel)
+
+        _jobs[job_id] = {'future': future, 'lines': lines, 'cancel': cancel}
+        _active_job_id = job_id
+    return jsonify({'job_id': job_id}), 202
+
+@app.route('/api/fetch-status/<job_id>')
+def fetch_status(job_id):
+    """Report a scraper job's status and any log lines after ?since=N"""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+
+    since = request.args.get('since', 0, type=int)
+    status = _job_status(job)
+    # Snapshot the length first; the worker may still be appending
+    end = len(job['lines'])
+
+    result = {
+        'status': status,
+        'lines': job['lines'][since:end],
+        'next': end
+    }
+    if status == 'done':
+        result['added'], result['skipped'] = job['future'].result()
+    elif status == 'error':
+        result['error'] = str(job['future'].exception())
+    return jsonify(result)
 
 @app.route('/api/cancel-fetch', methods=['POST'])
 def cancel_fetch():
-    """Cancel the running scraper process"""
-    global scraper_process
-    if scraper_process and scraper_process.poll() is None:
-        scraper_process.terminate()
-        scraper_process = None
+    """Cancel the running scraper job"""
+    job = _jobs.get(_active_job_id)
+    if job and not job['future'].done():
+        job['cancel'].set()
+        job['future'].cancel()
         return jsonify({'status': 'cancelled'})
     return jsonify({'status': 'not_running'})
 
 if __name__ == '__main__':
+    init_pool()
     init_db()
-    app.run(debug=True, port=5763)
+    app.run(port=5763, threaded=True)
@@ -0,0 +1,113 @@
+"""
+Shared SQLite setup for the web app and the scraper: database location,
+per-connection PRAGMAs and the schema.
+"""
+
+import sqlite3
+
+DB_PATH = 'esrb_ratings.db'
+
+# Applied to every new connection: WAL lets readers run alongside the
+# scraper's writes, and the larger page cache/mmap suit this read-heavy app
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+]
+
+def normalize_platform(platform):
+    """Rewrite a comma-separated platform list with exactly ", " between entries"""
+    if not platform:
+        return platform
+    return ', '.join(p.strip() for p in platform.split(','))
+
+def configure(conn):
+    """Apply the connection PRAGMAs"""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+def connect(**kwargs):
+    """Open a connection to DB_PATH with the PRAGMAs applied
+
+    Keyword arguments are passed through to sqlite3.connect.
+    """
+    conn = sqlite3.connect(DB_PATH, **kwargs)
+    configure(conn)
+    return conn
+
+def create_schema(conn):
+    """Create the tables, indexes and full-text index if they don't exist"""
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            game_id INTEGER PRIMARY KEY,
+            game_title TEXT NOT NULL,
+            platform TEXT,
+            rating TEXT,
+            descriptors TEXT,
+            url TEXT,
+            summary TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scrape_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            games_added INTEGER,
+            games_skipped INTEGER
+        )
+    ''')
+
+    # The export's platform filter relies on ", " separators; tidy any rows
+    # stored before platforms were normalized on insert
+    conn.create_function('normalize_platform', 1, normalize_platform, deterministic=True)
+    cursor.execute('''
+        UPDATE ratings SET platform = normalize_platform(platform)
+        WHERE platform != normalize_platform(platform)
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rating ON ratings(rating)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_title ON ratings(game_title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_platform ON ratings(platform)')
+    # game_id is the rowid, so every index above is already ordered by
+    # (column, game_id) and serves "filter + ORDER BY game_id" without a sort
+
+    # Trigram full-text index over titles so substring searches
+    # (LIKE '%...%') don't scan the whole table. It's an external-content
+    # table kept in sync with ratings by triggers.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'ratings_fts'")
+    fts_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS ratings_fts USING fts5(
+            game_title, content='ratings', content_rowid='game_id', tokenize='trigram'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ratings_ai AFTER INSERT ON ratings BEGIN
+            INSERT INTO ratings_fts(rowid, game_title) VALUES (new.game_id, new.game_title);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ratings_ad AFTER DELETE ON ratings BEGIN
+            INSERT INTO ratings_fts(ratings_fts, rowid, game_title) VALUES ('delete', old.game_id, old.game_title);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ratings_au AFTER UPDATE ON ratings BEGIN
+            INSERT INTO ratings_fts(ratings_fts, rowid, game_title) VALUES ('delete', old.game_id, old.game_title);
+            INSERT INTO ratings_fts(rowid, game_title) VALUES (new.game_id, new.game_title);
+        END
+    ''')
+    if not fts_exists:
+        # Index any titles that were stored before the FTS table existed
+        cursor.execute("INSERT INTO ratings_fts(ratings_fts) VALUES ('rebuild')")
+
+    conn.commit()
+
+    # Refresh planner statistics so it picks between these indexes sensibly
+    cursor.execute('ANALYZE')
@@ -3,41 +3,69 @@ ESRB Ratings Scraper
 Scrapes latest rated games from ESRB.org and stores them in SQLite database.
 """
 
-import sqlite3
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 import re
+import db
 
-DB_PATH = 'esrb_ratings.db'
 BASE_URL = 'https://www.esrb.org/search/'
 
+# Headers to mimic browser request
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/26.1 Safari/605.1.15',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+# Numeric game ID in an ESRB rating URL, e.g. /ratings/40682/super-mario-galaxy-2/
+_GAME_ID_RE = re.compile(r'/ratings/(\d+)/')
+
+# Only build the tree for game entries, skipping the page header, nav and footer.
+# While parsing, the strainer sees the raw class string, so match whole class
+# words the way find_all(class_='game') does (keeps class="game featured").
+GAME_STRAINER = SoupStrainer('div', class_=lambda c: c is not None and 'game' in c.split())
+
+# Pages fetched ahead of the one being parsed; also caps concurrent requests
+PREFETCH_PAGES = 4
+
+# Fixed SQL string so sqlite3's statement cache reuses the prepared statement.
+# OR IGNORE makes the insert double as the existence check on game_id.
+INSERT_GAME_SQL = '''
+    INSERT OR IGNORE INTO ratings (game_id, game_title, platform, rating, descriptors, url, summary)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+def get_connection():
+    """Open a database connection with the shared PRAGMAs applied"""
+    return db.connect(cached_statements=256)
+
 def extract_game_id(url):
     """Extract the game ID from an ESRB URL"""
     if not url:
         return None
-    match = re.search(r'/ratings/(\d+)/', url)
+    match = _GAME_ID_RE.search(url)
     if match:
         return int(match.group(1))
     return None
 
-def game_exists(conn, game_id):
-    """Check if a game with this ID already exists"""
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM ratings WHERE game_id = ?', (game_id,))
-    return cursor.fetchone()[0] > 0
-
-def insert_game(conn, game_data):
-    """Insert a new game into the database"""
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO ratings (game_id, game_title, platform, rating, descriptors, url, summary)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', game_data)
-    conn.commit()
-
-def parse_game_item(item):
-    """Extract game data from a game div element"""
+def existing_game_ids(conn, game_ids):
+    """Return the subset of game_ids already stored, in a single query"""
+    if not game_ids:
+        return set()
+    placeholders = ','.join('?' * len(game_ids))
+    cursor = conn.execute(f'SELECT game_id FROM ratings WHERE game_id IN ({placeholders})', game_ids)
+    return {row[0] for row in cursor}
+
+def insert_games(conn, batch):
+    """Insert a batch of new games, returning how many rows were added"""
+    cursor = conn.executemany(INSERT_GAME_SQL, batch)
+    return cursor.rowcount
+
+def parse_game_item(item, log=print):
+    """Extract game data from a game div element, reporting errors through log"""
     try:
         # Title and URL
         title_elem = item.find('h2')
@@ -57,7 +85,7 @@ def parse_game_item(item):
 
         # Platform
         platform_elem = item.find('div', class_='platforms')
-        platform = platform_elem.get_text(strip=True) if platform_elem else ''
+        platform = db.normalize_platform(platform_elem.get_text(strip=True)) if platform_elem else ''
 
         # Rating (from image alt attribute)
         rating_img = item.find('img', alt=True)
@@ -90,106 +118,135 @@ def parse_game_item(item):
         return (game_id, title, platform, rating, descriptors, url, summary)
 
     except Exception as e:
-        print(f"Error parsing game item: {e}")
+        log(f"Error parsing game item: {e}")
         return None
 
-def scrape_page(page):
-    """Scrape a single search results page"""
-    conn = sqlite3.connect(DB_PATH)
-    new_count = 0
-    skipped_count = 0
-
+def fetch_page(session, page):
+    """Download a single search results page and return its HTML"""
     # Construct URL with pagination
     url = f"{BASE_URL}?searchKeyword=&searchType=LatestRatings&pg={page}"
 
-    # Headers to mimic browser request
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/26.1 Safari/605.1.15',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-    }
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    sleep(1)  # Be respectful to the server; holds this worker's slot
+    return response.text
+
+def scrape_page(conn, page, pending_html, log=print):
+    """Parse and store a search results page once its download (a future) completes"""
+    new_count = 0
+    skipped_count = 0
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        html = pending_html.result()
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(html, 'lxml', parse_only=GAME_STRAINER)
 
         # Find all game items
         games = soup.find_all('div', class_='game')
 
         if not games:
-            print(f"  No more results on page {page}")
-            conn.close()
+            log(f"  No more results on page {page}")
             return new_count, skipped_count, False
 
-        print(f"  Processing page {page} ({len(games)} games)...")
-
-        for game in games:
-            game_data = parse_game_item(game)
-
-            if game_data and game_data[0]:  # Has game_id
-                game_id, title, platform, rating, descriptors = game_data[0], game_data[1], game_data[2], game_data[3], game_data[4]
-
-                if game_exists(conn, game_id):
-                    skipped_count += 1
-                    print(f"    ⊘ SKIPPED: {title}")
-                    print(f"      ID: {game_id} | Platform: {platform}")
-                    # Stop when we hit an existing game (since we're scraping latest first)
-                    conn.close()
-                    return new_count, skipped_count, False
-                else:
-                    insert_game(conn, game_data)
-                    new_count += 1
-                    print(f"    ✓ ADDED: {title}")
-                    print(f"      ID: {game_id} | Platform: {platform}")
-                    print(f"      Rating: {rating} | Descriptors: {descriptors[:50]}...")
-
-        sleep(1)  # Be respectful to the server
+        log(f"  Processing page {page} ({len(games)} games)...")
+
+        # Parse the whole page, then look up which of its games we already have
+        parsed = [parse_game_item(game, log) for game in games]
+        parsed = [game_data for game_data in parsed if game_data and game_data[0]]  # Has game_id
+        existing = existing_game_ids(conn, [game_data[0] for game_data in parsed])
+
+        batch = []
+        has_more = True
+        for game_data in parsed:
+            game_id, title, platform, rating, descriptors = game_data[0], game_data[1], game_data[2], game_data[3], game_data[4]
+
+            if game_id in existing:
+                skipped_count += 1
+                log(f"    ⊘ SKIPPED: {title}")
+                log(f"      ID: {game_id} | Platform: {platform}")
+                # Stop when we hit an existing game (since we're scraping latest first)
+                has_more = False
+                break
+
+            existing.add(game_id)  # A repeat later on this page counts as existing
+            batch.append(game_data)
+            log(f"    ✓ ADDED: {title}")
+            log(f"      ID: {game_id} | Platform: {platform}")
+            log(f"      Rating: {rating} | Descriptors: {descriptors[:50]}...")
+
+        # One transaction per page: commits once the batch is in and rolls
+        # back if anything raises
+        with conn:
+            new_count = insert_games(conn, batch)
 
     except Exception as e:
-        print(f"  Error fetching page {page}: {e}")
-        conn.close()
+        log(f"  Error fetching page {page}: {e}")
         return new_count, skipped_count, False
 
-    conn.close()
-    return new_count, skipped_count, True
+    return new_count, skipped_count, has_more
 
-def log_scrape_run(games_added, games_skipped):
+def log_scrape_run(conn, games_added, games_skipped):
     """Log the scrape run to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO scrape_log (games_added, games_skipped) VALUES (?, ?)',
-                   (games_added, games_skipped))
+    conn.execute('INSERT INTO scrape_log (games_added, games_skipped) VALUES (?, ?)',
+                 (games_added, games_skipped))
     conn.commit()
-    conn.close()
 
-def main():
-    """Main scraper function"""
-    print(f"=== ESRB Ratings Scraper ===")
-    print(f"Scraping latest rated games...\n")
+def main(log=print, cancel_event=None):
+    """Main scraper function
+
+    Progress lines go to log. If cancel_event is set, the scraper stops
+    before processing the next page. Returns (games_added, games_skipped).
+    """
+    log(f"=== ESRB Ratings Scraper ===")
+    log(f"Scraping latest rated games...\n")
 
     total_new = 0
     total_skipped = 0
-    page = 1
     max_pages = 50  # Safety limit
 
-    while page <= max_pages:
-        new, skipped, has_more = scrape_page(page)
-        total_new += new
-        total_skipped += skipped
-
-        if not has_more:
-            break
-
-        page += 1
+    # One connection for the whole run so cached statements are reused, and
+    # one keep-alive session shared by the download workers. Pages download
+    # a few ahead on worker threads while this thread parses and inserts.
+    conn = get_connection()
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    executor = ThreadPoolExecutor(max_workers=PREFETCH_PAGES)
+    try:
+        pending = deque()
+        next_page = 1
+
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                log("  Cancelled")
+                break
+
+            while next_page <= max_pages and len(pending) < PREFETCH_PAGES:
+                pending.append((next_page, executor.submit(fetch_page, session, next_page)))
+                next_page += 1
+
+            if not pending:
+                break
+
+            page, pending_html = pending.popleft()
+            new, skipped, has_more = scrape_page(conn, page, pending_html, log)
+            total_new += new
+            total_skipped += skipped
+
+            if not has_more:
+                break
+
+        # Log the scrape run
+        log_scrape_run(conn, total_new, total_skipped)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        session.close()
+        conn.close()
 
-    # Log the scrape run
-    log_scrape_run(total_new, total_skipped)
+    log(f"\n=== Scrape Complete ===")
+    log(f"New games added: {total_new}")
+    log(f"Existing games skipped: {total_skipped}")
 
-    print(f"\n=== Scrape Complete ===")
-    print(f"New games added: {total_new}")
-    print(f"Existing games skipped: {total_skipped}")
+    return total_new, total_skipped
 
 if __name__ == '__main__':
     main()
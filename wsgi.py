@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    gunicorn -k gthread -w 1 --threads 8 --preload -b 127.0.0.1:5763 wsgi:app
+"""
+
+from app import app, init_db, close_pool
+
+init_db()
+
+# Don't carry open SQLite connections across a fork (gunicorn --preload);
+# each worker opens its own pool on its first request
+close_pool()